@@ -14,6 +14,8 @@ identify the SRX on which the command must be triggered.
 -------
 Requirements:
 mistapi: https://pypi.org/project/mistapi/
+pandas (optional): https://pypi.org/project/pandas/ - speeds up the parsing
+of large reports when installed
 
 -------
 Usage:
@@ -36,6 +38,8 @@ Options:
                     default is "./report_gateway_firmware.csv"
 --auto-approve      Does not ask for user confirmation before triggering the 
                     firmware backup API Calls
+--dry-run           only parse the report and display the devices that would be
+                    processed, without triggering any API Call
 
 -l, --log_file=     define the filepath/filename where to write the logs
                     default is "./script.log"
@@ -53,15 +57,37 @@ python3 ./fix_gateway_backup_firmware.py --site_id=203d3d02-xxxx-xxxx-xxxx-76896
 #### IMPORTS #####
 import sys
 import csv
+import datetime
 import getopt
+import json
 import logging
+import mmap
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from urllib3.util.retry import Retry
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 MISTAPI_MIN_VERSION = "0.53.0"
 
 try:
     import mistapi
     from mistapi.__logger import console as CONSOLE
-except:
+except ImportError:
         print("""
         Critical: 
         \"mistapi\" package is missing. Please use the pip command to install it.
@@ -83,15 +109,27 @@ LOGGER = logging.getLogger(__name__)
 CSV_FILE = "./report_gateway_firmware.csv"
 LOG_FILE = "./script.log"
 ENV_FILE = "~/.mist_env"
+MAX_WORKERS = 16
+SNAPSHOT_RETRY_MAX_ATTEMPTS = 6
+SNAPSHOT_RETRY_STATUS_CODES = (429, 502, 503, 504)
+SNAPSHOT_CACHE_FILE = "./.snapshot_done.json"
+SNAPSHOT_CACHE_TTL = 60 * 60 * 24
+CSV_REQUIRED_COLUMNS = ("module_model", "cluster_site_id", "cluster_device_id", "module_mac", "module_need_snapshot")
 
 
 
 #####################################################################
 # PROGRESS BAR AND DISPLAY
 class ProgressBar:
+    # static part of the bar line, built once instead of per update
+    _PB_PREFIX = "Progress: "
+
     def __init__(self):
         self.steps_total = 0
         self.steps_count = 0
+        # serializes the counter update and the stdout write of a step, so
+        # concurrent workers neither miscount nor interleave escape codes
+        self._lock = threading.Lock()
 
     def _pb_update(self, size: int = 80):
         if self.steps_count > self.steps_total:
@@ -100,9 +138,12 @@ class ProgressBar:
         percent = self.steps_count / self.steps_total
         delta = 17
         x = int((size - delta) * percent)
-        print(f"Progress: ", end="")
-        print(f"[{'█'*x}{'.'*(size-delta-x)}]", end="")
-        print(f"{int(percent*100)}%".rjust(5), end="")
+        # single write + flush: one syscall and one stdout-lock acquisition
+        # per update instead of one per print call
+        sys.stdout.write(
+            f"{self._PB_PREFIX}[{'█'*x}{'.'*(size-delta-x)}]{f'{int(percent*100)}%'.rjust(5)}"
+        )
+        sys.stdout.flush()
 
     def _pb_new_step(
         self,
@@ -112,22 +153,25 @@ class ProgressBar:
         size: int = 80,
         display_pbar: bool = True,
     ):
-        if inc:
-            self.steps_count += 1
-        text = f"\033[A\033[F{message}"
-        print(f"{text} ".ljust(size + 4, "."), result)
-        print("".ljust(80))
-        if display_pbar:
-            self._pb_update(size)
+        with self._lock:
+            if inc:
+                self.steps_count += 1
+            line = f"\033[A\033[F{message} ".ljust(size + 4, ".") + f" {result}\n" + "".ljust(80) + "\n"
+            sys.stdout.write(line)
+            if display_pbar:
+                self._pb_update(size)
+            else:
+                sys.stdout.flush()
 
     def _pb_title(
         self, text: str, size: int = 80, end: bool = False, display_pbar: bool = True
     ):
-        print("\033[A")
-        print(f" {text} ".center(size, "-"), "\n\n")
-        if not end and display_pbar:
-            print("".ljust(80))
-            self._pb_update(size)
+        with self._lock:
+            print("\033[A")
+            print(f" {text} ".center(size, "-"), "\n\n")
+            if not end and display_pbar:
+                print("".ljust(80))
+                self._pb_update(size)
 
     def set_steps_total(self, steps_total: int):
         self.steps_total = steps_total
@@ -162,56 +206,226 @@ PB = ProgressBar()
 
 ###############################################################################
 #### FUNCTIONS ####
-def _process_gateways(apisession:mistapi.APISession, gateways:list) -> list:
-    i=0
-    PB.set_steps_total(len(gateways))
-    for gateway in gateways:
-        site_id = gateway.get("cluster_site_id")
-        device_id = gateway.get("cluster_device_id")
-        device_mac = gateway.get("module_mac")
-        message = f"Processing device {device_id}"
-        PB.log_message(message)
-        if not site_id:
-            PB.log_failure(message, inc=True)
-            CONSOLE.error(f"Missing site_id for device {device_mac}")
-            continue
-        if not device_id:
-            PB.log_failure(message, inc=True)
-            CONSOLE.error(f"Missing device_id for device {device_mac}")
+class _KeepAliveAdapter(requests.adapters.HTTPAdapter):
+    '''
+    HTTPAdapter enabling TCP keep-alive on the pooled sockets, so idle
+    connections are not silently reset by NAT/firewalls between bursts of
+    snapshot calls.
+    '''
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+def _setup_session(apisession:mistapi.APISession) -> None:
+    '''
+    Mount a pooled HTTPAdapter on the mistapi session so all the API calls
+    reuse the same keep-alive connections instead of serializing behind the
+    default 10-connection pool. The pool is sized above MAX_WORKERS and
+    transient 5xx answers are retried with backoff at the transport level.
+    '''
+    adapter = _KeepAliveAdapter(
+        pool_connections=64,
+        pool_maxsize=64,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    )
+    apisession._session.mount("https://", adapter)
+
+def _load_snapshot_cache() -> dict:
+    '''
+    Load the {device_id: iso_timestamp} checkpoint left by previous runs.
+    Entries older than SNAPSHOT_CACHE_TTL (24h) are dropped, so a stale
+    checkpoint never hides a device that needs a fresh snapshot.
+    '''
+    try:
+        with open(SNAPSHOT_CACHE_FILE, "rb") as f:
+            cache = orjson.loads(f.read()) if orjson else json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        # valid JSON but not an object (hand-edited file): treat it like
+        # any other unusable checkpoint
+        return {}
+    limit = datetime.datetime.now() - datetime.timedelta(seconds=SNAPSHOT_CACHE_TTL)
+    valid = {}
+    for device_id, timestamp in cache.items():
+        try:
+            if datetime.datetime.fromisoformat(timestamp) >= limit:
+                valid[device_id] = timestamp
+        except (TypeError, ValueError):
             continue
+    return valid
+
+def _save_snapshot_cache(cache:dict) -> None:
+    tmp_file = f"{SNAPSHOT_CACHE_FILE}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(orjson.dumps(cache) if orjson else json.dumps(cache).encode())
+    os.replace(tmp_file, SNAPSHOT_CACHE_FILE)
+
+def _create_snapshot(apisession:mistapi.APISession, site_id:str, device_id:str):
+    '''
+    Call createSiteDeviceSnapshot with bounded retries and exponential
+    backoff (with jitter), so a transient 429/5xx or connection error is
+    turned into a delayed success instead of a permanently lost snapshot.
+    Honors the Retry-After header when the cloud provides one.
+    '''
+    # resolve the nested attribute chain once instead of per attempt
+    create_snapshot = mistapi.api.v1.sites.devices.createSiteDeviceSnapshot
+    delay = 0.5
+    resp = None
+    for attempt in range(SNAPSHOT_RETRY_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, 30)
         try:
-            resp = mistapi.api.v1.sites.devices.createSiteDeviceSnapshot(apisession, site_id, device_id)
-            if resp.status_code == 200:
-                PB.log_success(message, inc=True)
-            else:
-                PB.log_failure(message, inc=True)
-        except:
+            resp = create_snapshot(apisession, site_id, device_id)
+        except requests.RequestException:
+            LOGGER.warning(f"createSiteDeviceSnapshot failed for device {device_id} (attempt {attempt+1}/{SNAPSHOT_RETRY_MAX_ATTEMPTS})", exc_info=True)
+            continue
+        if resp.status_code not in SNAPSHOT_RETRY_STATUS_CODES:
+            return resp
+        retry_after = (resp.headers or {}).get("Retry-After")
+        if retry_after:
+            try:
+                delay = max(delay, int(retry_after))
+            except ValueError:
+                pass
+        LOGGER.warning(f"createSiteDeviceSnapshot returned HTTP {resp.status_code} for device {device_id} (attempt {attempt+1}/{SNAPSHOT_RETRY_MAX_ATTEMPTS})")
+    return resp
+
+def _process_gateway(apisession:mistapi.APISession, gateway:dict, cache_lock:threading.Lock, cache:dict, dry_run:bool=False) -> None:
+    site_id = gateway.get("cluster_site_id")
+    device_id = gateway.get("cluster_device_id")
+    device_mac = gateway.get("module_mac")
+    message = f"Processing device {device_id}"
+    if not site_id:
+        PB.log_failure(message, inc=True)
+        CONSOLE.error(f"Missing site_id for device {device_mac}")
+        return
+    if not device_id:
+        PB.log_failure(message, inc=True)
+        CONSOLE.error(f"Missing device_id for device {device_mac}")
+        return
+    if dry_run:
+        PB.log_success(f"{message} (dry-run)", inc=True)
+        return
+    try:
+        resp = _create_snapshot(apisession, site_id, device_id)
+        if resp and resp.status_code == 200:
+            PB.log_success(message, inc=True)
+            with cache_lock:
+                cache[device_id] = datetime.datetime.now().isoformat()
+                _save_snapshot_cache(cache)
+        else:
             PB.log_failure(message, inc=True)
-            LOGGER.error("Exception occurred", exc_info=True)
+    except Exception:
+        PB.log_failure(message, inc=True)
+        LOGGER.error("Exception occurred", exc_info=True)
+
+def _process_gateways(apisession:mistapi.APISession, gateways:list, cache:dict, dry_run:bool=False) -> None:
+    cache_lock = threading.Lock()
+    PB.set_steps_total(len(gateways))
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for gateway in gateways:
+            executor.submit(_process_gateway, apisession, gateway, cache_lock, cache, dry_run)
 
 ### READ REPORT
+def _validate_csv_header(header:list) -> None:
+    '''
+    Fail fast on a report missing required columns, before any data row is
+    parsed, with an error naming the missing column(s).
+    '''
+    missing = [column for column in CSV_REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Invalid CSV Report: missing column(s) {', '.join(missing)}")
+
+def _read_csv_pandas(csv_file:str, site_id:str) -> list:
+    '''
+    Vectorized fast path: parse and filter the report with the pandas C
+    engine instead of a per-row Python loop. Only used when pandas is
+    installed.
+    '''
+    with open(csv_file, newline='') as f:
+        reader = csv.reader(row for row in f if not row.startswith("#"))
+        header = next(reader, None)
+    if not header:
+        # empty or comment-only report: nothing to fix, same as the
+        # python path
+        return []
+    _validate_csv_header(header)
+    df = pd.read_csv(
+        csv_file,
+        comment="#",
+        usecols=["module_model", "cluster_site_id", "cluster_device_id", "module_mac", "module_need_snapshot"],
+        dtype=str,
+        engine="c",
+    )
+    mask = (df["module_need_snapshot"] == "True") & df["module_model"].str.startswith("SRX", na=False)
+    if site_id:
+        mask &= df["cluster_site_id"] == site_id
+    df = df[mask].drop_duplicates("cluster_device_id")
+    return df[["cluster_site_id", "cluster_device_id", "module_mac", "module_model"]].fillna("").to_dict("records")
+
+def _read_csv_python(csv_file:str, site_id:str) -> list:
+    data = []
+    device_ids = set()
+    # memory-map the report so the parser reads straight from the OS page
+    # cache instead of copying the file through a userspace buffer
+    with open(csv_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return data
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            lines = (line.decode("utf-8") for line in iter(mm.readline, b""))
+            reader = csv.reader(row for row in lines if row[0] != "#")
+            header = next(reader, None)
+            if header:
+                _validate_csv_header(header)
+                model_idx = header.index("module_model")
+                site_id_idx = header.index("cluster_site_id")
+                device_id_idx = header.index("cluster_device_id")
+                mac_idx = header.index("module_mac")
+                need_snapshot_idx = header.index("module_need_snapshot")
+                max_idx = max(model_idx, site_id_idx, device_id_idx, mac_idx, need_snapshot_idx)
+                for row in reader:
+                    # a truncated row must not abort the whole report
+                    if len(row) <= max_idx:
+                        LOGGER.debug(f"skipping malformed row: {row}")
+                        continue
+                    # cheapest checks first: most rows fail the equality
+                    # tests, so the substring search on the model is only
+                    # paid by the few rows still in the race
+                    if row[need_snapshot_idx] != "True":
+                        continue
+                    row_site_id = row[site_id_idx]
+                    if site_id and row_site_id != site_id:
+                        continue
+                    model = row[model_idx]
+                    if not model.startswith("SRX"):
+                        continue
+                    device_id = row[device_id_idx]
+                    if device_id in device_ids:
+                        continue
+                    data.append({
+                        "cluster_site_id": row_site_id,
+                        "cluster_device_id": device_id,
+                        "module_mac": row[mac_idx],
+                        "module_model": model,
+                    })
+                    device_ids.add(device_id)
+    return data
+
 def _read_csv(csv_file:str, site_id:str) -> list:
     data = []
-    device_ids = []
     message="Reading CSV Report"
     PB.log_message(message, display_pbar=False)
     try:
-        with open(csv_file, newline='') as f:
-            reader = csv.DictReader(filter(lambda row: row[0]!='#', f))
-            for row in reader:
-                if not "SRX" in row.get("module_model"):
-                    continue
-                if site_id and row.get("cluster_site_id") != site_id:
-                    continue
-                if row.get("module_need_snapshot") != "True": 
-                    continue
-                if row.get("cluster_device_id") in device_ids:
-                    continue
-                data.append(row)
-                device_ids.append(row.get("cluster_device_id"))
+        if pd:
+            data = _read_csv_pandas(csv_file, site_id)
+        else:
+            data = _read_csv_python(csv_file, site_id)
         PB.log_success(message, inc=False, display_pbar=False)
-    except:
+    except (OSError, csv.Error, ValueError) as error:
         PB.log_failure(message, inc=False, display_pbar=False)
+        CONSOLE.error(f"Unable to read the CSV Report: {error}")
         LOGGER.error("Exception occurred", exc_info=True)
         sys.exit(1)
     return data
@@ -232,17 +446,26 @@ def _request_approval(data:dict):
 
 ###############################################################################
 ### START
-def _start(apisession: mistapi.APISession, site_id: str, csv_file:str=CSV_FILE, auto_approve:bool=False) -> None:
+def _start(apisession: mistapi.APISession, site_id: str, csv_file:str=CSV_FILE, auto_approve:bool=False, dry_run:bool=False) -> None:
 
     data = _read_csv(csv_file, site_id)
+    cache = _load_snapshot_cache()
+    if cache:
+        remaining = [d for d in data if d.get("cluster_device_id") not in cache]
+        skipped = len(data) - len(remaining)
+        if skipped:
+            CONSOLE.info(f"{skipped} device(s) already snapshotted in the last 24h (see {SNAPSHOT_CACHE_FILE}), skipping them")
+        data = remaining
     if not data:
         print("All the gateways are compliant... Exiting...")
         sys.exit(0)
-    if auto_approve:
+    if dry_run:
+        CONSOLE.info("dry-run parameter has been set to True. No API Call will be issued")
+    elif auto_approve:
         CONSOLE.info("auto-approve parameter has been set to True. Starting the process")
     else:
         _request_approval(data)
-    _process_gateways(apisession, data)
+    _process_gateways(apisession, data, cache, dry_run)
 
 
 ###############################################################################
@@ -264,6 +487,8 @@ identify the SRX on which the command must be triggered.
 -------
 Requirements:
 mistapi: https://pypi.org/project/mistapi/
+pandas (optional): https://pypi.org/project/pandas/ - speeds up the parsing
+of large reports when installed
 
 -------
 Usage:
@@ -286,6 +511,8 @@ Options:
                     default is "./report_gateway_firmware.csv"
 --auto-approve      Does not ask for user confirmation before triggering the 
                     firmware backup API Calls
+--dry-run           only parse the report and display the devices that would be
+                    processed, without triggering any API Call
 
 -l, --log_file=     define the filepath/filename where to write the logs
                     default is "./script.log"
@@ -332,13 +559,14 @@ def check_mistapi_version():
 ### ENTRY POINT
 if __name__ == "__main__":
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hs:f:e:l:", ["help", "site_id", "in_file=", "auto-approve", "env=", "log_file="])
+        opts, args = getopt.getopt(sys.argv[1:], "hs:f:e:l:", ["help", "site_id", "in_file=", "auto-approve", "dry-run", "env=", "log_file="])
     except getopt.GetoptError as err:
         CONSOLE.error(err)
         usage()
 
     SITE_ID=None
     AUTO_APPROVE=False
+    DRY_RUN=False
     for o, a in opts:
         if o in ["-h", "--help"]:
             usage()
@@ -348,6 +576,8 @@ if __name__ == "__main__":
             CSV_FILE=a
         elif o in ["--auto-approve"]:
             AUTO_APPROVE=True
+        elif o in ["--dry-run"]:
+            DRY_RUN=True
         elif o in ["-e", "--env"]:
             ENV_FILE=a
         elif o in ["-l", "--log_file"]:
@@ -363,5 +593,6 @@ if __name__ == "__main__":
     ### MIST SESSION ###
     APISESSION = mistapi.APISession(env_file=ENV_FILE)
     APISESSION.login()
+    _setup_session(APISESSION)
     ### START ###
-    _start(APISESSION, SITE_ID, CSV_FILE, AUTO_APPROVE)
+    _start(APISESSION, SITE_ID, CSV_FILE, AUTO_APPROVE, DRY_RUN)
@@ -63,7 +63,10 @@ import sys
 import csv
 import datetime
 import getopt
+import itertools
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 MISTAPI_MIN_VERSION = "0.44.1"
 
@@ -83,6 +86,24 @@ except:
         """)
         sys.exit(2)
 
+def _version_tuple(version:str) -> tuple:
+    '''
+    Numeric (major, minor, patch) tuple for a version string. Lexicographic
+    string comparison sorts "0.44.10" before "0.44.9", so versions must be
+    compared numerically.
+    '''
+    parts = []
+    for part in version.split(".")[:3]:
+        digits = ""
+        for char in part:
+            if not char.isdigit():
+                break
+            digits += char
+        parts.append(int(digits or 0))
+    return tuple(parts)
+
+# computed once at import so check_mistapi_version is a plain flag test
+MISTAPI_VERSION_OK = _version_tuple(mistapi.__version__) >= _version_tuple(MISTAPI_MIN_VERSION)
 
 
 #### LOGS ####
@@ -93,19 +114,48 @@ out=sys.stdout
 CSV_FILE = "./report_gateway_firmware.csv"
 LOG_FILE = "./script.log"
 ENV_FILE = "~/.mist_env"
+MAX_WORKERS = 10
+PAGE_LIMIT = 1000
+GATEWAYS_CACHE_TTL = 300
+
+#### CONSTANTS ####
+# static schema of the rows emitted by _process_module, so the CSV header
+# does not have to be rediscovered by iterating the whole dataset
+HEADERS = (
+    "cluster_name",
+    "cluster_version",
+    "cluster_device_id",
+    "cluster_site_id",
+    "module_serial",
+    "module_mac",
+    "module_model",
+    "module_version",
+    "module_backup_version",
+    "module_need_snapshot",
+    "module_pending_version",
+    "module_need_reboot",
+)
 
 
 ###############################################################################
 ### PROGRESS BAR
-def _progress_bar_update(count:int, total:int, size:int):
+# bar strings precomputed per size on first use: only size+1 distinct
+# fill levels exist, so repeating '█'*x/'.'*(size-x) per tick just
+# re-allocates the same strings
+_PROGRESS_BARS = {}
+
+def _progress_bar_update(count:int, total:int, size:int, _prefix="Progress: ".ljust(10)):
+    # _prefix is evaluated once at definition time; the whole line is then
+    # emitted with a single write + flush instead of three writes per tick
     if total == 0:
         return
     if count > total:
         count = total
+    bars = _PROGRESS_BARS.get(size)
+    if bars is None:
+        bars = _PROGRESS_BARS[size] = [f"[{'█'*x}{'.'*(size-x)}]" for x in range(size + 1)]
     x = int(size*count/total)
-    out.write(f"Progress: ".ljust(10))
-    out.write(f"[{'█'*x}{'.'*(size-x)}]")
-    out.write(f"{count}/{total}\r".rjust(79 - size - 10))
+    out.write(f"{_prefix}{bars[x]}" + f"{count}/{total}\r".rjust(79 - size - 10))
     out.flush()
 
 def _progress_bar_end(total:int, size:int):
@@ -122,77 +172,157 @@ def _process_module(
         cluster_version:str,
         cluster_device_id:str,
         cluster_site_id:str,
-        module:dict,
-        data:dict
-        ) -> None:
-    data.append({
-        "cluster_name": cluster_name,
-        "cluster_version": cluster_version,
-        "cluster_device_id": cluster_device_id,
-        "cluster_site_id": cluster_site_id,
-        "module_serial": module.get("serial"),
-        "module_mac": module.get("mac"),
-        "module_model": module.get("model"),
-        "module_version": module.get("version"),
-        "module_backup_version": module.get("backup_version"),
-        "module_need_snapshot": module.get("version") != module.get("backup_version"),
-        "module_pending_version": module.get("pending_version"),
-        "module_need_reboot": module.get("pending_version", "") != ""
-    })
-
-def _process_gateways(gateways:list) -> list:
+        module:dict
+        ) -> tuple:
+    # row tuple in HEADERS order: no per-row dict allocation, no per-column
+    # key hashing when the row is written out. The versions are looked up
+    # once and reused for both the column value and the derived flags.
+    version = module.get("version")
+    backup_version = module.get("backup_version")
+    pending_version = module.get("pending_version", "")
+    return (
+        cluster_name,
+        cluster_version,
+        cluster_device_id,
+        cluster_site_id,
+        module.get("serial"),
+        module.get("mac"),
+        module.get("model"),
+        version,
+        backup_version,
+        version != backup_version,
+        pending_version,
+        pending_version != ""
+    )
+
+# shared empty default for _first: avoids allocating a fresh [{}] for
+# every cluster just to index into it
+_EMPTY_MODULE = {}
+
+def _first(modules):
+    '''
+    First entry of a module_stat list, or the shared empty dict when the
+    list is missing or empty (some stats entries report "module_stat": []).
+    '''
+    return modules[0] if modules else _EMPTY_MODULE
+
+def _process_gateways(gateways:list):
+    '''
+    Generator yielding one row per module, so rows are written out as they
+    are produced instead of being buffered in a second list.
+    '''
     i=0
-    data = []
-    _progress_bar_update(i, len(gateways), 55)
+    total = len(gateways)
+    _progress_bar_update(i, total, 55)
     for cluster in gateways:
-        if True:#"SRX" in cluster.get("version", ""):
-            cluster_name = cluster.get("name")
-            cluster_version = cluster.get("version")
-            cluster_device_id = cluster.get("id")
-            cluster_site_id = cluster.get("site_id")
-            _process_module(cluster_name, cluster_version, cluster_device_id, cluster_site_id, cluster.get("module_stat", [{}])[0], data)
-            if cluster.get("module2_stat"):
-                _process_module(cluster_name, cluster_version,  cluster_device_id, cluster_site_id, cluster.get("module2_stat", [{}])[0], data)
+        cluster_name = cluster.get("name")
+        cluster_version = cluster.get("version")
+        cluster_device_id = cluster.get("id")
+        cluster_site_id = cluster.get("site_id")
+        yield _process_module(cluster_name, cluster_version, cluster_device_id, cluster_site_id, _first(cluster.get("module_stat")))
+        if cluster.get("module2_stat"):
+            yield _process_module(cluster_name, cluster_version,  cluster_device_id, cluster_site_id, _first(cluster.get("module2_stat")))
         i+=1
-        _progress_bar_update(i, len(gateways), 55)
-    _progress_bar_end(len(gateways), 55)
-    return data
-
-def _get_org_gateways(apisession, org_id:str) -> list:
+        # only redraw every 64 gateways (and on the last one): the string
+        # formatting and flush per tick otherwise dominate the loop
+        if i & 0x3F == 0 or i == total:
+            _progress_bar_update(i, total, 55)
+    _progress_bar_end(total, 55)
+
+def _get_page_total(response) -> int:
+    '''
+    Number of pages to fetch, computed from the X-Page-Total header of the
+    first response. The page size comes from the X-Page-Limit header (the
+    cloud may clamp it below the requested PAGE_LIMIT; mistapi treats that
+    header as authoritative too). Returns 0 when either header is absent
+    or invalid, in which case the caller falls back to the sequential
+    next-link walk.
+    '''
+    headers = response.headers or {}
+    try:
+        total = int(headers.get("X-Page-Total", 0))
+        limit = int(headers.get("X-Page-Limit", PAGE_LIMIT))
+    except (TypeError, ValueError):
+        return 0
+    if limit <= 0:
+        return 0
+    return -(-total // limit)
+
+_GATEWAYS_CACHE = {}
+
+def _cached_gateways(fn):
+    '''
+    Cache the gateway list returned by "fn" for GATEWAYS_CACHE_TTL seconds,
+    keyed by function, scope id and Mist cloud, so repeated runs against the
+    same scope within the TTL (e.g. when the script is driven from another
+    tool) skip the whole paginated retrieval.
+    '''
+    def wrapper(apisession, scope_id:str) -> list:
+        key = (fn.__name__, scope_id, getattr(apisession, "_cloud_uri", ""))
+        cached = _GATEWAYS_CACHE.get(key)
+        if cached and time.time() - cached[0] < GATEWAYS_CACHE_TTL:
+            return cached[1]
+        # the fetchers are generators; the list is materialized here, once,
+        # both for the cache and for the progress-bar total downstream
+        gateways = list(fn(apisession, scope_id))
+        _GATEWAYS_CACHE[key] = (time.time(), gateways)
+        return gateways
+    return wrapper
+
+@_cached_gateways
+def _get_org_gateways(apisession, org_id:str):
     print(" Retrieving Gateways ".center(80, '-'))
-    response = mistapi.api.v1.orgs.stats.listOrgDevicesStats(apisession, org_id, type="gateway", limit=1000)
-    gateways = response.data
-    while response.next:
-        response = mistapi.get_next(apisession, response)
-        gateways = gateways + response.data
-    return gateways
-
-def _get_site_gateways(apisession, site_id:str) -> list:
+    response = mistapi.api.v1.orgs.stats.listOrgDevicesStats(apisession, org_id, type="gateway", limit=PAGE_LIMIT)
+    yield from response.data
+    page_total = _get_page_total(response)
+    if page_total > 1:
+        # page count is known from the first response, so the remaining
+        # pages can be fetched concurrently instead of one RTT per page
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for page_response in executor.map(
+                lambda page: mistapi.api.v1.orgs.stats.listOrgDevicesStats(apisession, org_id, type="gateway", limit=PAGE_LIMIT, page=page),
+                range(2, page_total + 1),
+            ):
+                yield from page_response.data
+    else:
+        while response.next:
+            response = mistapi.get_next(apisession, response)
+            yield from response.data
+
+@_cached_gateways
+def _get_site_gateways(apisession, site_id:str):
     print(" Retrieving Gateways ".center(80, '-'))
-    response = mistapi.api.v1.sites.stats.listSiteDevicesStats(apisession, site_id, type="gateway", limit=1000)
-    gateways = response.data
-    while response.next:
-        response = mistapi.get_next(apisession, response)
-        gateways = gateways + response.data
-    return gateways
+    response = mistapi.api.v1.sites.stats.listSiteDevicesStats(apisession, site_id, type="gateway", limit=PAGE_LIMIT)
+    yield from response.data
+    page_total = _get_page_total(response)
+    if page_total > 1:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for page_response in executor.map(
+                lambda page: mistapi.api.v1.sites.stats.listSiteDevicesStats(apisession, site_id, type="gateway", limit=PAGE_LIMIT, page=page),
+                range(2, page_total + 1),
+            ):
+                yield from page_response.data
+    else:
+        while response.next:
+            response = mistapi.get_next(apisession, response)
+            yield from response.data
 
 ### SAVE REPORT
 def _save_as_csv(
-        data:list,
+        data,
         scope:str,
         scope_id:str,
         csv_file:str,
         append_dt:bool,
         append_ts:bool
     ):
-
+    '''
+    Stream the rows produced by _process_gateways straight into the CSV
+    file. The header is the static HEADERS schema, so no discovery pass
+    over the data is needed and rows are never buffered.
+    '''
     print(" Saving Data ".center(80, "-"))
     print()
-    print("Generating CSV Headers ".ljust(80,"."))
-
-    headers=[]
-    size = 50
-    total = len(data)
 
     if append_dt:
         dt = datetime.datetime.isoformat(datetime.datetime.now()).split('.')[0].replace(':','.')
@@ -201,30 +331,24 @@ def _save_as_csv(
         ts = round(datetime.datetime.timestamp(datetime.datetime.now()))
         csv_file = f"{csv_file.replace('.csv', f'_{ts}')}.csv"
 
-    i = 0
-    for entry in data:
-        for key in entry:
-            if not key in headers:
-                headers.append(key)
-        i += 1
-        _progress_bar_update(i, total, size)
-    _progress_bar_end(total, size)
-    print()
     print("Saving to file ".ljust(80,"."))
-    i = 0
-    with open(csv_file, "w", encoding='UTF8', newline='') as f:
-        csv_writer = csv.writer(f)
+    total = 0
+    data = iter(data)
+    with open(csv_file, "w", encoding='UTF8', newline='', buffering=1<<20) as f:
+        csv_writer = csv.writer(f, lineterminator="\n")
         csv_writer.writerow([f"#Gateways Firmware Backup for {scope} {scope_id}"])
-        csv_writer.writerow(headers)
-        for entry in data:
-            tmp=[]
-            for header in headers:
-                tmp.append(entry.get(header, ""))
-            csv_writer.writerow(tmp)
-            i += 1
-            _progress_bar_update(i, total, size)
-        _progress_bar_end(total, size)
-        print()
+        csv_writer.writerow(HEADERS)
+        # consume the row generator in slices and hand each slice to
+        # writerows, keeping the per-row loop in C without buffering the
+        # whole report
+        while True:
+            batch = list(itertools.islice(data, 1024))
+            if not batch:
+                break
+            csv_writer.writerows(batch)
+            total += len(batch)
+    print()
+    print(f"{total} modules saved to {csv_file}")
 
 ####################
 ## MENU
@@ -232,13 +356,20 @@ def _show_menu(header:str, menu:list) -> str:
     print()
     print("".center(80, "-"))
     resp=None
+    i = len(menu)
+    # the menu text never changes between retries, so build it once and
+    # emit it with a single write instead of one print per entry
+    menu_text = "\n".join([header] + [f"{index}) {entry}" for index, entry in enumerate(menu)])
+    prompt = f"Please select an option (0-{i-1}, q to quit): "
     while True:
-        print(f"{header}")
-        i=0
-        for entry in menu:
-            print(f"{i}) {entry}")
-            i+=1
-        resp = input(f"Please select an option (0-{i-1}, q to quit): ")
+        sys.stdout.write(menu_text + "\n" + prompt)
+        sys.stdout.flush()
+        line = sys.stdin.readline()
+        if not line:
+            # stdin EOF (e.g. non-interactive run): exit instead of
+            # re-prompting forever
+            sys.exit(0)
+        resp = line.strip()
         if resp.lower() == "q":
             sys.exit(0)
         else:
@@ -291,19 +422,14 @@ def _start(
             scope_id = mistapi.cli.select_site(apisession)[0]
 
     gateways = None
-    data = None
     if scope == "org":
         gateways = _get_org_gateways(apisession, scope_id)
     elif scope == "site":
         gateways = _get_site_gateways(apisession, scope_id)
     print(" Processing gateways ".center(80, '-'))
     if gateways:
-        data = _process_gateways(gateways)
-
-    if data:
+        _save_as_csv(_process_gateways(gateways), scope, scope_id, csv_file, append_dt, append_ts)
         print(" Process Done ".center(80, '-'))
-        _save_as_csv(data, scope, scope_id, csv_file, append_dt, append_ts)
-        mistapi.cli.pretty_print(data)
 
 
 ###############################################################################
@@ -376,7 +502,7 @@ python3 ./report_gateway_firmware.py --site_id=203d3d02-xxxx-xxxx-xxxx-76896a333
     sys.exit(0)
 
 def check_mistapi_version():
-    if mistapi.__version__ < MISTAPI_MIN_VERSION:
+    if not MISTAPI_VERSION_OK:
         logger.critical(f"\"mistapi\" package version {MISTAPI_MIN_VERSION} is required, you are currently using version {mistapi.__version__}.")
         logger.critical(f"Please use the pip command to updated it.")
         logger.critical("")
@@ -39,13 +39,17 @@ python3 import_admins.py <path_to_the_csv_file>"
 import sys
 import csv
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
 
 MISTAPI_MIN_VERSION = "0.44.1"
 
 try:
     import mistapi
     from mistapi.__logger import console
-except:
+except ImportError:
         print("""
         Critical: 
         \"mistapi\" package is missing. Please use the pip command to install it.
@@ -63,6 +67,7 @@ csv_separator = ","
 privileges = []
 env_file="~/.mist_env"
 log_file = "./script.log"
+max_workers = 16
 
 #####################################################################
 #### LOGS ####
@@ -72,6 +77,15 @@ logger = logging.getLogger(__name__)
 roles = {"s": "admin", "n": "write", "o": "read", "h":"helpdesk"}
 
 #### FUNCTIONS ####
+def setup_session(apisession):
+    '''
+    Mount a pooled HTTPAdapter on the mistapi session so all the invite calls
+    reuse the same keep-alive connections instead of opening a new TCP+TLS
+    connection per request.
+    '''
+    adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    apisession._session.mount("https://", adapter)
+
 def define_privileges(apisession, org_id):
     '''
     Generate the privilege parameters for the specified orgs.
@@ -98,33 +112,64 @@ def define_privileges(apisession, org_id):
             privileges.append({"scope": "org", "org_id": org_id, "site_id":site_id, "role":roles[role]})
             break 
 
+def read_invites(file_path):
+    '''
+    Read and validate all the rows from the "file_path" file before any invite
+    is sent, so a malformed row aborts the whole import instead of leaving a
+    partial batch of invites behind.
+    '''
+    invites = []
+    invalid_lines = []
+    with open(file_path, 'r') as my_file:
+        invite_file = csv.reader(my_file, delimiter=csv_separator)
+        for line_number, row in enumerate(invite_file, start=1):
+            if len(row) < 3 or "@" not in row[0]:
+                invalid_lines.append(line_number)
+            else:
+                invites.append(row)
+    if invalid_lines:
+        console.error(f"Invalid CSV row(s) {invalid_lines}: 3 columns expected (email, first name, last name). Aborting")
+        sys.exit(1)
+    return invites
+
+def send_invite(apisession, org_id, row, print_lock):
+    '''
+    send a single admin invite and display the result.
+    '''
+    body = {
+        "email": row[0],
+        "first_name": row[1],
+        "last_name": row[2],
+        "privileges": privileges
+    }
+    try:
+        response = mistapi.api.v1.orgs.invites.inviteOrgAdmin(apisession, org_id, body)
+        success = response.status_code == 200
+    except Exception:
+        logger.error("Exception occurred", exc_info=True)
+        success = False
+    with print_lock:
+        print(', '.join(row).ljust(80), end="", flush=True)
+        if success:
+            print("\033[92m\u2714\033[0m")
+        else:
+            print('\033[31m\u2716\033[0m')
+
 def import_admins(apisession, file_path, org_id):
     '''
     create all the administrators from the "file_path" file.
     '''
     print(f"Opening CSV file {file_path}")
     try:
-        with open(file_path, 'r') as my_file:
-            invite_file = csv.reader(my_file, delimiter=csv_separator)
-            for row in invite_file:  
-                body = {
-                "email": row[0],
-                "first_name":row[1],
-                "last_name": row[2],
-                "privileges": privileges      
-                }
-                print(', '.join(row).ljust(80), end="", flush=True)
-                try:
-                    response = mistapi.api.v1.orgs.invites.inviteOrgAdmin(apisession, org_id, body)
-                    if response.status_code == 200:
-                        print("\033[92m\u2714\033[0m")
-                    else:
-                        print('\033[31m\u2716\033[0m')
-                except: 
-                    print('\033[31m\u2716\033[0m')
-    except Exception as e:
+        invites = read_invites(file_path)
+    except (OSError, csv.Error) as e:
         print("Error while opening the CSV file... Aborting")
         print(e)
+        return
+    print_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for row in invites:
+            executor.submit(send_invite, apisession, org_id, row, print_lock)
 
 def check_mistapi_version():
     if mistapi.__version__ < MISTAPI_MIN_VERSION:
@@ -163,6 +208,7 @@ if __name__ == "__main__":
     file_path = sys.argv[1]
     apisession = mistapi.APISession(env_file=env_file)
     apisession.login()
+    setup_session(apisession)
 
     org_id = mistapi.cli.select_org(apisession)[0]
 